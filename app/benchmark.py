@@ -0,0 +1,349 @@
+# benchmark.py
+# Benchmarki wydajności uruchamiane ręcznie: python benchmark.py
+# Test skalowania (kod wyjścia 1 przy wzroście ponadliniowym): python benchmark.py scaling [max_MB] [kształt...]
+import contextlib
+import io
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from PIL import Image
+from epub_container import EpubContainer, close_epub, open_epub
+from font_fallback import FontChain
+from layout import paginate
+from mock_epd import GHOSTING_LIMIT, MockEPD
+from synthetic_epub import SHAPES, generate_epub
+
+runningDir = os.path.dirname(os.path.abspath(__file__))
+bookshelfPath = os.path.join(runningDir, "Bookshelf")
+fontDirectory = os.path.join(runningDir, "Fonts")
+cacheDirectory = os.path.join(runningDir, "cache")
+
+
+def read_paragraphs(path):
+    book = open_epub(path)
+    paragraphs = []
+    for index in range(len(book.spine)):
+        paragraphs.extend(book.paragraphs(index))
+    return paragraphs
+
+
+def timed(func, *args, repeat=3):
+    """Returns the best wall time of `repeat` runs (in s) and the last result."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def layout_args(main, app, chain):
+    # The reader's own page geometry, at the default font size
+    return app.reader.layout_args(chain, main.DEFAULT_FONT_SIZE)
+
+
+def bench_layout():
+    main, app = load_app()
+    fonts = sorted(f for f in os.listdir(fontDirectory) if f.lower().endswith('.ttf'))
+    print("== Layout ==")
+
+    start = time.perf_counter()
+    FontChain(fontDirectory, fonts, cacheDirectory)
+    print(f"font chain load (cached coverage): {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    for book in sorted(os.listdir(bookshelfPath)):
+        paragraphs = read_paragraphs(os.path.join(bookshelfPath, book))
+        # Wymuszenie segmentacji: akapity ze znakiem spoza czcionki głównej
+        mixed = [p + " → ★" for p in paragraphs]
+        print(f"{book[:40]}: {len(paragraphs)} paragraphs")
+
+        for font_name in fonts:
+            single = FontChain(fontDirectory, [font_name], cacheDirectory)
+            chain = FontChain(fontDirectory, [font_name] + [f for f in fonts if f != font_name], cacheDirectory)
+
+            t_single, (pages, _) = timed(paginate, paragraphs, single, *layout_args(main, app, single), repeat=1)
+            t_chain, _ = timed(paginate, paragraphs, chain, *layout_args(main, app, chain), repeat=1)
+            t_mixed, _ = timed(paginate, mixed, chain, *layout_args(main, app, chain), repeat=1)
+            print(f"  {font_name:<20} single face {t_single:.3f} s | fallback chain {t_chain:.3f} s"
+                  f" | chain, every paragraph segmented {t_mixed:.3f} s | {len(pages)} pages")
+
+
+def bench_extraction():
+    print("== Extraction ==")
+    for book in sorted(os.listdir(bookshelfPath)):
+        path = os.path.join(bookshelfPath, book)
+        t_cold, container = timed(EpubContainer, path)
+        container.close()
+        open_epub(path)
+        t_cached, container = timed(open_epub, path)
+        middle = len(container.spine) // 2
+        t_chapter, _ = timed(container.paragraphs, middle)
+        t_full, _ = timed(read_paragraphs, path)
+        print(f"{book[:40]}: open {t_cold * 1000:.1f} ms, cached {t_cached * 1000:.3f} ms"
+              f" | spine item {middle}/{len(container.spine)} {t_chapter * 1000:.1f} ms | whole book {t_full:.3f} s")
+
+
+# Reading session replayed against each refresh policy: (screen, partial, dwell) where
+# screen and partial are as passed to Screen.update_display in main.py and dwell is
+# the simulated time (s) the user spends on that screen before the next key
+SESSION_PAGES = 60
+READ_SECONDS = 60
+MENU_SECONDS = 3
+SESSION = ([("logo", True, 0), ("blank", False, 0)]
+           + [("menu", True, MENU_SECONDS)] * 4 + [("file_manager", True, MENU_SECONDS)] * 3
+           + [("page", False, READ_SECONDS)] * SESSION_PAGES + [("menu", True, MENU_SECONDS)] * 2)
+
+
+def refresh_current(screen, image, kind, partial, state):
+    # Screen.update_display from main.py, unchanged
+    screen.update_display(image, partial)
+
+
+def refresh_partial(screen, image, kind, partial, state):
+    # Page turns go partial too; any refresh is full once the panel has GHOSTING_LIMIT partials on it
+    epd = screen.app.epd
+    partial = (partial or kind == "page") and epd.ghosting < GHOSTING_LIMIT
+    screen.update_display(image, partial)
+
+
+def refresh_partial_keep_mode(screen, image, kind, partial, state):
+    # As above, but the panel is only re-initialised when the refresh mode changes
+    epd = screen.app.epd
+    partial = (partial or kind == "page") and epd.ghosting < GHOSTING_LIMIT
+    if state.get('mode') != partial:
+        if partial:
+            epd.init_part()
+        else:
+            epd.init()
+        state['mode'] = partial
+    epd.display(epd.getbuffer(image))
+
+
+def refresh_partial_sleep(screen, image, kind, partial, state):
+    # As refresh_partial, with the panel put to deep sleep while the user reads;
+    # update_display re-initialises (wakes) it on the next refresh
+    refresh_partial(screen, image, kind, partial, state)
+    screen.app.epd.sleep()
+
+
+def bench_refresh_policy():
+    main, app = load_app()
+    reading = sum(dwell for _, _, dwell in SESSION) / 60
+    print(f"== Refresh policy (simulated 7.5\" V2, {SESSION_PAGES} page turns, {reading:.0f} min session) ==")
+    image = Image.new('1', (main.width, main.height), 255)
+    policies = [
+        ("Screen.update_display (current)", refresh_current),
+        (f"partial, full after {GHOSTING_LIMIT} partials", refresh_partial),
+        ("as above, init on mode change", refresh_partial_keep_mode),
+        ("partial, deep sleep between screens", refresh_partial_sleep),
+    ]
+    for name, policy in policies:
+        # A fresh panel per policy, driven through the app's own Screen
+        app.epd = MockEPD(headless=True)
+        screen = main.Screen(app)
+        state = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for kind, partial, dwell in SESSION:
+                policy(screen, image, kind, partial, state)
+                app.epd.dwell(dwell)
+        report = app.epd.report()
+        ops = report['operations']
+        print(f"{name:<36} {report['seconds']:6.1f} s busy {report['energy_mj']:8.1f} mJ"
+              f" ({report['idle_mj']:6.1f} mJ idle/standby) | sleep {ops['sleep']}, init {ops['init'] + ops['init_part']}"
+              f" | max ghosting {report['max_ghosting']}")
+
+
+def load_app():
+    # main.py sets up the display on import, so it is loaded with a headless mock
+    os.environ.setdefault("EBOOK_EMULATOR", "headless")
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+        return main, main.EbookReader()
+
+
+def bench_menu_navigation(steps=50):
+    main, app = load_app()
+
+    print("== Menu navigation (image for one selection change) ==")
+    menus = [
+        ("main menu", app.main_menu, app.main_menu.get_menu_image),
+        ("font size", app.fontsize_menu, app.fontsize_menu.get_font_size_image),
+        ("font", app.font_menu, app.font_menu.get_font_choice_image),
+        ("file manager", app.file_manager, app.file_manager.get_file_image),
+    ]
+    for name, menu, get_image in menus:
+        count = len(menu.get_items())
+
+        def navigate(cached):
+            for step in range(steps):
+                if not cached:
+                    menu.frames.clear()
+                    main.top_bar_cache.clear()
+                    main.battery_state['pct'] = None
+                menu.selected_idx = step % count
+                get_image()
+
+        t_cold, _ = timed(navigate, False)
+        navigate(True)
+        t_cached, _ = timed(navigate, True)
+        print(f"{name:<14} full rebuild {t_cold / steps * 1000:.2f} ms | cached frame {t_cached / steps * 1000:.2f} ms")
+
+
+SIZE_CLASSES_MB = (1, 2, 5, 10, 20, 50, 100, 200)
+MAX_GROWTH_EXPONENT = 1.3     # time or memory ~ size^k; k above this counts as superlinear
+MIN_SIZE_CLASSES = 3          # fewer measured sizes are too noisy to judge growth
+MIN_MEASURABLE = {'s': 0.005, 'heap MB': 1.0, 'RSS MB': 1.0}  # below this, growth is noise
+RSS_SAMPLE_INTERVAL = 0.005   # s
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where it cannot be read."""
+    if sys.platform.startswith('linux'):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                    'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        get_process = ctypes.windll.kernel32.GetCurrentProcess
+        get_process.restype = wintypes.HANDLE
+        get_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+        get_info(get_process(), ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize
+    return None
+
+
+def measured(func, *args, reset=None):
+    """
+    Runs func twice: a memory pass for the Python heap peak (MB, tracemalloc) and
+    the peak process RSS growth (MB, sampled; includes PIL and lxml buffers, None
+    where RSS is unavailable), then a timing pass with no tracing or sampler thread
+    competing for the GIL. `reset` is called before each pass (e.g. to drop caches).
+    Returns wall time (s), heap, RSS and the result of the timing pass.
+    """
+    if reset:
+        reset()
+    baseline = current_rss()
+    peak_rss = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(RSS_SAMPLE_INTERVAL):
+            peak_rss[0] = max(peak_rss[0], current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    if baseline is not None:
+        sampler.start()
+
+    # The memory pass runs first, so freed memory the allocator keeps from the
+    # timing pass cannot hide RSS growth
+    tracemalloc.start()
+    result = func(*args)
+    heap = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+
+    rss = None
+    if baseline is not None:
+        done.set()
+        sampler.join()
+        rss = (max(peak_rss[0], current_rss()) - baseline) / 1024 / 1024
+    del result
+
+    if reset:
+        reset()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    return elapsed, heap, rss, result
+
+
+def growth_exponent(points):
+    """Least-squares slope of log(value) over log(size), i.e. k in value ~ size^k."""
+    xs = [math.log(size) for size, _ in points]
+    ys = [math.log(value) for _, value in points]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    return (sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+            / sum((x - mean_x) ** 2 for x in xs))
+
+
+def render_pages(reader, pages):
+    # First, middle and last page; time is per page
+    reader.pages, reader.total_pages = pages, len(pages)
+    for page in (0, len(pages) // 2, len(pages) - 1):
+        reader.current_page = page
+        reader.get_page_image()
+
+
+def bench_scaling(max_mb=5, shapes=None):
+    """
+    Extraction, layout and rendering of synthetic books for each size class up to
+    max_mb. Returns False when any phase grows superlinearly with the book size,
+    judged over all measured sizes once at least MIN_SIZE_CLASSES were measured.
+    """
+    main, app = load_app()
+    chain = FontChain(fontDirectory, ['DejaVuSans.ttf', 'Courier Prime.ttf'], cacheDirectory)
+    sizes = [s for s in SIZE_CLASSES_MB if s <= max_mb]
+    ok = True
+
+    print(f"== Scaling ({', '.join(f'{s} MB' for s in sizes)}) ==")
+    if len(sizes) < MIN_SIZE_CLASSES:
+        print(f"  only {len(sizes)} size classes, growth is reported but not judged (need {MIN_SIZE_CLASSES})")
+    with tempfile.TemporaryDirectory() as tmp:
+        for shape in shapes or SHAPES:
+            results = {}
+            for size in sizes:
+                path = os.path.join(tmp, f"{shape}_{size}.epub")
+                items = generate_epub(path, size, shape)
+
+                t_ext, h_ext, r_ext, paragraphs = measured(read_paragraphs, path, reset=lambda: close_epub(path))
+                t_lay, h_lay, r_lay, (pages, _) = measured(paginate, paragraphs, chain, *layout_args(main, app, chain))
+                t_ren, h_ren, r_ren, _ = measured(render_pages, app.reader, pages)
+                results[size] = {
+                    'extraction': {'s': t_ext, 'heap MB': h_ext, 'RSS MB': r_ext},
+                    'layout': {'s': t_lay, 'heap MB': h_lay, 'RSS MB': r_lay},
+                    'render': {'s': t_ren / 3, 'heap MB': h_ren, 'RSS MB': r_ren},
+                }
+                print(f"{shape:<16} {size:>4} MB, {items:>6} items, {len(pages):>7} pages |" + " |".join(
+                    f" {phase} " + " ".join(f"{v:.2f} {unit}" if v is not None else f"n/a {unit}" for unit, v in metrics.items())
+                    for phase, metrics in results[size].items()))
+
+                # The cached container keeps the ZIP open, which blocks deleting it on Windows
+                close_epub(path)
+                os.remove(path)
+
+            for phase in results[sizes[0]]:
+                for unit in MIN_MEASURABLE:
+                    points = [(size, results[size][phase][unit]) for size in sizes
+                              if results[size][phase][unit] is not None and results[size][phase][unit] >= MIN_MEASURABLE[unit]]
+                    if len(points) < 2:
+                        continue
+                    exponent = growth_exponent(points)
+                    print(f"  {phase} {unit} ~ size^{exponent:.2f} over {len(points)} sizes")
+                    if len(points) >= MIN_SIZE_CLASSES and exponent > MAX_GROWTH_EXPONENT:
+                        ok = False
+                        print(f"  SUPERLINEAR: {shape} {phase} {unit} grows as size^{exponent:.2f}")
+    return ok
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "scaling":
+        max_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+        sys.exit(0 if bench_scaling(max_mb, sys.argv[3:] or None) else 1)
+
+    bench_menu_navigation()
+    bench_refresh_policy()
+    bench_extraction()
+    bench_layout()
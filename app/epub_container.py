@@ -0,0 +1,148 @@
+# epub_container.py
+import codecs
+import os
+import posixpath
+import re
+import zipfile
+from collections import OrderedDict
+from bs4 import BeautifulSoup
+from lxml import etree
+
+CHUNK_SIZE = 16 * 1024
+MAX_OPEN_CONTAINERS = 4
+SKIPPED_TAGS = {'header', 'footer', 'nav', 'script', 'style'}
+
+# EPUB content documents are UTF-8 or UTF-16; libxml2's HTML parser would guess Latin-1
+BOMS = ((codecs.BOM_UTF8, 'UTF-8'), (codecs.BOM_UTF16_LE, 'UTF-16LE'), (codecs.BOM_UTF16_BE, 'UTF-16BE'))
+XML_ENCODING_RE = re.compile(rb'\s*<\?xml[^>]*encoding=["\']([A-Za-z0-9._-]+)["\']')
+
+# path -> (size, mtime) key and container; the open ZipFile keeps its parsed central directory
+_containers = OrderedDict()
+
+
+def open_epub(path):
+    """
+    Returns the container for an EPUB, reusing the cached one (central
+    directory, manifest and spine) as long as the file size and mtime match.
+    """
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+
+    cached = _containers.pop(path, None)
+    if cached and cached[0] == key:
+        _containers[path] = cached
+        return cached[1]
+    if cached:
+        cached[1].close()
+
+    container = EpubContainer(path)
+    _containers[path] = (key, container)
+    while len(_containers) > MAX_OPEN_CONTAINERS:
+        _, (_, oldest) = _containers.popitem(last=False)
+        oldest.close()
+    return container
+
+
+def close_epub(path):
+    """Closes and forgets the cached container of a file (e.g. before deleting it)."""
+    cached = _containers.pop(path, None)
+    if cached:
+        cached[1].close()
+
+
+def detect_encoding(head):
+    """
+    Returns the encoding of a content document from its first bytes (BOM, then
+    XML declaration, UTF-8 otherwise) and the length of the BOM to skip.
+    """
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    # UTF-16 without a BOM: the first character is ASCII '<'
+    if head.startswith(b'<\x00'):
+        return 'UTF-16LE', 0
+    if head.startswith(b'\x00<'):
+        return 'UTF-16BE', 0
+    match = XML_ENCODING_RE.match(head)
+    return (match.group(1).decode('ascii') if match else 'UTF-8'), 0
+
+
+class EpubContainer:
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path, 'r')
+
+        # Parse container.xml to get OPF path
+        container = BeautifulSoup(self.zip.read('META-INF/container.xml'), 'xml')
+        opf_path = container.rootfiles.rootfile['full-path']
+        opf_dir = posixpath.dirname(opf_path)
+        opf = BeautifulSoup(self.zip.read(opf_path), 'xml')
+
+        # Spine-based reading order, resolved to member names in the ZIP
+        self.manifest = {item['id']: item['href'] for item in opf.find_all('item') if 'application/xhtml+xml' in item.get('media-type', '')}
+        self.spine = []
+        for itemref in opf.find_all('itemref'):
+            href = self.manifest.get(itemref['idref'])
+            if href:
+                self.spine.append(f"{opf_dir}/{href}" if opf_dir else href)
+
+    def close(self):
+        self.zip.close()
+
+    def iter_chunks(self, name, chunk_size=CHUNK_SIZE):
+        """Decompresses a member chunk by chunk instead of reading it whole."""
+        with self.zip.open(name) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def parse(self, name):
+        chunks = self.iter_chunks(name)
+        head = next(chunks, b"")
+        encoding, bom_length = detect_encoding(head)
+
+        try:
+            parser = etree.HTMLParser(encoding=encoding)
+        except LookupError:
+            # Declared encoding libxml2 does not know (utf-8-sig, x-mac-roman, typos)
+            parser = etree.HTMLParser(encoding='UTF-8')
+        parser.feed(head[bom_length:])
+        for chunk in chunks:
+            parser.feed(chunk)
+        return parser.close()
+
+    def paragraphs(self, index):
+        """
+        Extracts the non-empty <p>/<div> texts of a single spine item, without
+        touching the other members.
+        """
+        try:
+            root = self.parse(self.spine[index])
+        except etree.XMLSyntaxError:
+            root = None
+        if root is None:
+            # Empty member, nothing to read
+            return []
+        for tag in list(root.iter(*SKIPPED_TAGS)):
+            parent = tag.getparent()
+            if parent is not None:
+                # Keep the tail text, it belongs to the parent
+                if tag.tail:
+                    previous = tag.getprevious()
+                    if previous is not None:
+                        previous.tail = (previous.tail or "") + tag.tail
+                    else:
+                        parent.text = (parent.text or "") + tag.tail
+                parent.remove(tag)
+
+        # libxml2 closes a <p> before a nested <div>, so text after the <div>
+        # (<p>a <div>b</div> tail</p>) is dropped; bs4 kept it. Accepted, such
+        # markup is invalid HTML and rare in EPUBs.
+        paragraphs = []
+        for el in root.iter('p', 'div'):
+            text = "".join(s.strip() for s in el.itertext())
+            if text:
+                paragraphs.append(text)
+        return paragraphs
@@ -0,0 +1,188 @@
+# font_fallback.py
+import os
+import struct
+import threading
+from PIL import ImageFont
+
+# Header of a cached coverage file: font file size, mtime (ns) and bitset length
+CACHE_HEADER = struct.Struct("<QQQ")
+
+
+def _read_cmap_codepoints(font_path):
+    """
+    Reads the codepoints mapped to a real glyph in the font's cmap table.
+    Supports subtable formats 4 (BMP) and 12 (full Unicode).
+
+    Args:
+        font_path (str): Path to a TTF file.
+
+    Returns:
+        set: Codepoints covered by the font.
+    """
+    with open(font_path, 'rb') as f:
+        data = f.read()
+
+    num_tables = struct.unpack_from(">H", data, 4)[0]
+    cmap_offset = None
+    for i in range(num_tables):
+        tag, _, offset, _ = struct.unpack_from(">4sIII", data, 12 + 16 * i)
+        if tag == b'cmap':
+            cmap_offset = offset
+            break
+    if cmap_offset is None:
+        return set()
+
+    # Pick the best Unicode subtable: format 12 first, then format 4
+    num_subtables = struct.unpack_from(">H", data, cmap_offset + 2)[0]
+    subtables = {}
+    for i in range(num_subtables):
+        platform_id, encoding_id, offset = struct.unpack_from(">HHI", data, cmap_offset + 4 + 8 * i)
+        if platform_id in (0, 3):
+            fmt = struct.unpack_from(">H", data, cmap_offset + offset)[0]
+            subtables.setdefault(fmt, cmap_offset + offset)
+
+    codepoints = set()
+    if 12 in subtables:
+        base = subtables[12]
+        num_groups = struct.unpack_from(">I", data, base + 12)[0]
+        for i in range(num_groups):
+            start, end, start_glyph = struct.unpack_from(">III", data, base + 16 + 12 * i)
+            codepoints.update(range(start if start_glyph else start + 1, end + 1))
+    elif 4 in subtables:
+        base = subtables[4]
+        seg_count = struct.unpack_from(">H", data, base + 6)[0] // 2
+        end_codes = struct.unpack_from(f">{seg_count}H", data, base + 14)
+        start_codes = struct.unpack_from(f">{seg_count}H", data, base + 16 + 2 * seg_count)
+        deltas = struct.unpack_from(f">{seg_count}h", data, base + 16 + 4 * seg_count)
+        range_offsets_pos = base + 16 + 6 * seg_count
+        range_offsets = struct.unpack_from(f">{seg_count}H", data, range_offsets_pos)
+
+        for i in range(seg_count):
+            start, end = start_codes[i], end_codes[i]
+            if start == 0xFFFF:
+                continue
+            for cp in range(start, end + 1):
+                if range_offsets[i] == 0:
+                    glyph = (cp + deltas[i]) & 0xFFFF
+                else:
+                    pos = range_offsets_pos + 2 * i + range_offsets[i] + 2 * (cp - start)
+                    glyph = struct.unpack_from(">H", data, pos)[0]
+                    if glyph:
+                        glyph = (glyph + deltas[i]) & 0xFFFF
+                if glyph:
+                    codepoints.add(cp)
+    return codepoints
+
+
+class GlyphCoverage:
+    """Bitset of the codepoints a font can render, one bit per codepoint."""
+
+    def __init__(self, bits):
+        self.bits = bits
+
+    def __contains__(self, codepoint):
+        byte = codepoint >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] >> (codepoint & 7) & 1)
+
+    @classmethod
+    def from_codepoints(cls, codepoints):
+        bits = bytearray((max(codepoints) >> 3) + 1 if codepoints else 0)
+        for cp in codepoints:
+            bits[cp >> 3] |= 1 << (cp & 7)
+        return cls(bytes(bits))
+
+    @classmethod
+    def load(cls, font_path, cache_dir):
+        """
+        Returns the coverage of a font, building it from the cmap only when
+        the cached bitset is missing or the font file changed (size/mtime).
+        """
+        stat = os.stat(font_path)
+        cache_path = os.path.join(cache_dir, os.path.basename(font_path) + ".cmap")
+
+        try:
+            with open(cache_path, 'rb') as f:
+                size, mtime, length = CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+                bits = f.read()
+            if (size, mtime) == (stat.st_size, stat.st_mtime_ns) and len(bits) == length:
+                return cls(bits)
+        except (OSError, struct.error):
+            pass
+
+        coverage = cls.from_codepoints(_read_cmap_codepoints(font_path))
+        header = CACHE_HEADER.pack(stat.st_size, stat.st_mtime_ns, len(coverage.bits))
+        # Written to a temp file and swapped in, so readers never see a partial bitset
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(header + coverage.bits)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            print(f"Could not write glyph coverage cache: {cache_path}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return coverage
+
+
+class FontChain:
+    """
+    Ordered list of font faces. Each character is rendered with the first face
+    whose cmap covers it; characters no face covers stay with the primary one.
+    """
+
+    def __init__(self, font_dir, font_names, cache_dir):
+        self.font_dir = font_dir
+        self.font_names = list(font_names)
+        self.coverages = [GlyphCoverage.load(os.path.join(font_dir, name), cache_dir) for name in self.font_names]
+        self.primary = self.coverages[0]
+        self._fonts = {}
+
+    def font(self, face, size):
+        key = (face, size)
+        if key not in self._fonts:
+            try:
+                self._fonts[key] = ImageFont.truetype(os.path.join(self.font_dir, self.font_names[face]), size)
+            except OSError:
+                self._fonts[key] = ImageFont.load_default()
+        return self._fonts[key]
+
+    def face_for(self, char):
+        cp = ord(char)
+        for face, coverage in enumerate(self.coverages):
+            if cp in coverage:
+                return face
+        return 0
+
+    def covers(self, text):
+        primary = self.primary
+        return all(ord(char) in primary for char in set(text))
+
+    def segment(self, text):
+        """
+        Splits text into runs rendered by the same face.
+
+        Returns:
+            list: (face index, text) tuples in reading order.
+        """
+        runs = []
+        run_face, run_start = 0, 0
+        for i, char in enumerate(text):
+            face = 0 if ord(char) in self.primary else self.face_for(char)
+            if face != run_face:
+                if i > run_start:
+                    runs.append((run_face, text[run_start:i]))
+                run_face, run_start = face, i
+        if len(text) > run_start:
+            runs.append((run_face, text[run_start:]))
+        return runs
+
+    def textlength(self, draw, text, size):
+        return sum(draw.textlength(run, font=self.font(face, size)) for face, run in self.segment(text))
+
+    def draw_text(self, draw, xy, text, size, fill):
+        x, y = xy
+        for face, run in self.segment(text):
+            font = self.font(face, size)
+            draw.text((x, y), run, font=font, fill=fill)
+            x += draw.textlength(run, font=font)
@@ -0,0 +1,65 @@
+# layout.py
+import re
+from PIL import Image, ImageDraw
+
+WORD_RE = re.compile(r'\S+')
+
+
+def paginate(paragraphs, chain, font_size, max_width, lines_per_page):
+    """
+    Wraps paragraphs into lines no wider than max_width and groups them into pages.
+
+    Args:
+        paragraphs (list): Paragraph strings in reading order.
+        chain (FontChain): Fonts used to measure the text.
+        font_size (int): Font size in px.
+        max_width (int): Maximum line width in px.
+        lines_per_page (int): Number of lines that fit on one page.
+
+    Returns:
+        tuple: Page strings (lines separated by "\\n") and, for every page, the
+        (paragraph index, character offset) its first line starts at.
+    """
+    dummy_img = Image.new('RGB', (1, 1))
+    draw = ImageDraw.Draw(dummy_img)
+    font = chain.font(0, font_size)
+
+    pages, page_starts = [], []
+    current_lines, line_starts = [], []
+
+    for para_idx, para in enumerate(paragraphs):
+        # Paragraphs the primary face fully covers skip per-line run segmentation
+        if chain.covers(para):
+            textlength = lambda text: draw.textlength(text, font=font)
+        else:
+            textlength = lambda text: chain.textlength(draw, text, font_size)
+
+        line, line_start = "", 0
+        for match in WORD_RE.finditer(para):
+            word = match.group()
+            test_line = f"{line} {word}".strip()
+            if textlength(test_line) <= max_width:
+                if not line:
+                    line_start = match.start()
+                line = test_line
+            else:
+                current_lines.append(line)
+                line_starts.append((para_idx, line_start if line else match.start()))
+                line, line_start = word, match.start()
+        if line:
+            current_lines.append(line)
+            line_starts.append((para_idx, line_start))
+        current_lines.append("")  # paragraph break
+        line_starts.append((para_idx, len(para)))
+
+        while len(current_lines) >= lines_per_page:
+            pages.append("\n".join(current_lines[:lines_per_page]))
+            page_starts.append(line_starts[0])
+            current_lines = current_lines[lines_per_page:]
+            line_starts = line_starts[lines_per_page:]
+
+    if current_lines:
+        pages.append("\n".join(current_lines))
+        page_starts.append(line_starts[0])
+
+    return pages, page_starts
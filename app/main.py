@@ -2,19 +2,24 @@
 import os
 import sys
 import time
-import zipfile
 import textwrap
-from bs4 import BeautifulSoup
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageDraw, ImageFont
 import platform
 import json
 from battery_monitor import calculate_battery_percentage, read_battery_voltage 
 from button_pressed import is_button_pressed
+from font_fallback import FontChain
+from layout import paginate
+from epub_container import open_epub
+from search import BookSearch
+from scheduler import IdleScheduler
 
 # Set up e-paper display
-if platform.system() == "Windows":
+# EBOOK_EMULATOR: "1" runs the emulator on any OS, "headless" without a window (benchmarks)
+EMULATOR = os.environ.get("EBOOK_EMULATOR")
+if platform.system() == "Windows" or EMULATOR:
     from mock_epd import MockEPD as EPD
-    epd = EPD()
+    epd = EPD(headless=EMULATOR == "headless")
     runningDir = os.path.dirname(os.path.abspath(__file__))
     bookshelfPath = os.path.join(runningDir, "Bookshelf")
 else:
@@ -68,6 +73,7 @@ if not os.path.exists(fontPath):
     sys.exit(1)
 
 available_fonts = sorted([f for f in os.listdir(fontDirectory) if f.lower().endswith('.ttf')])
+cacheDirectory = os.path.join(runningDir, "cache")
 
 # Utility function for loading fonts
 def load_font(font_name, font_size):
@@ -76,9 +82,33 @@ def load_font(font_name, font_size):
     except:
         return ImageFont.load_default()
 
+# Fallback chain: the chosen font first, then the remaining available fonts
+font_chains = {}
+
+def load_font_chain(font_name):
+    if font_name not in font_chains:
+        fallbacks = [f for f in available_fonts if f != font_name]
+        font_chains[font_name] = FontChain(fontDirectory, [font_name] + fallbacks, cacheDirectory)
+    return font_chains[font_name]
+
 # Status font
 status_font = load_font(settings['font_name'], 14)
 
+# Battery is read at most once per BATTERY_READ_INTERVAL seconds
+BATTERY_READ_INTERVAL = 60
+battery_state = {'pct': None, 'read_at': 0.0}
+
+def battery_percentage():
+    now = time.monotonic()
+    if battery_state['pct'] is None or now - battery_state['read_at'] >= BATTERY_READ_INTERVAL:
+        battery_state['pct'] = calculate_battery_percentage(read_battery_voltage())
+        battery_state['read_at'] = now
+    return battery_state['pct']
+
+# Rendered top bars as masks, keyed by (screen name, font, size, battery %)
+TOP_BAR_LAYER_HEIGHT = 60
+top_bar_cache = {}
+
 # Base screen with shared display logic
 class Screen:
     def __init__(self, app):
@@ -93,7 +123,29 @@ class Screen:
         rotated_image = image.rotate(0)
         self.app.epd.display(self.app.epd.getbuffer(rotated_image))
 
+    def read_key(self, prompt):
+        key = input(prompt)
+        # Every keypress pre-empts background work until input is idle again
+        self.app.scheduler.notify_input()
+        return key
+
     def draw_top_bar(self, image, screen_name=""):
+        battery_pct = battery_percentage()
+        key = (screen_name, settings['font_name'], settings['font_size'], battery_pct)
+        mask = top_bar_cache.get(key)
+        if mask is None:
+            # Layers for the old battery level are stale
+            if any(cached[3] != battery_pct for cached in top_bar_cache):
+                top_bar_cache.clear()
+            layer = Image.new('1', (width, TOP_BAR_LAYER_HEIGHT), WHITE)
+            self.render_top_bar(layer, screen_name, battery_pct)
+            mask = ImageChops.invert(layer.convert('L')).convert('1')
+            top_bar_cache[key] = mask
+
+        # The bar only draws black, so stamp its black pixels onto the image
+        image.paste(BLACK, (0, 0, width, TOP_BAR_LAYER_HEIGHT), mask)
+
+    def render_top_bar(self, image, screen_name, battery_pct):
         draw = ImageDraw.Draw(image)
         bar_height = 30
         padding = 10
@@ -105,7 +157,6 @@ class Screen:
         text_height = ascent + abs(descent)
 
         # Battery 
-        battery_pct = calculate_battery_percentage(read_battery_voltage())
 
         battery_text = f"{battery_pct}%"
         battery_text_width = draw.textlength(battery_text, font=bold_font)
@@ -190,6 +241,25 @@ class StartupAnimationScreen(Screen):
 
 # Menus
 class MenuScreen(Screen):
+    def __init__(self, app):
+        super().__init__(app)
+        self.frames = {}
+
+    def get_frame(self, key, draw_items):
+        # Items and footer without highlight or top bar, rendered once per key
+        frame = self.frames.get(key)
+        if frame is None:
+            frame = self.app.empty_image.copy()
+            draw_items(ImageDraw.Draw(frame))
+            self.frames[key] = frame
+        return frame
+
+    def compose(self, frame, screen_name, highlight_box):
+        image = frame.copy()
+        self.draw_top_bar(image, screen_name=screen_name)
+        ImageDraw.Draw(image).rectangle(highlight_box, outline=BLACK)
+        return image
+
     def handle_input(self, key):
         if key == 'w' and self.selected_idx > 0:
             self.selected_idx -= 1
@@ -219,26 +289,21 @@ class MainMenu(MenuScreen):
         self.selected_idx = 0
 
     def get_menu_image(self):
-        image = self.app.empty_image.copy()
-        draw = ImageDraw.Draw(image)
+        start = max(0, self.selected_idx - self.visible_items() // 2)
+        frame = self.get_frame((settings['font_name'], settings['font_size'], start), lambda draw: self.draw_items(draw, start))
 
-        # Draw the top bar with screen name
-        self.draw_top_bar(image, screen_name="Menu")
+        y_offset = MENU_PADDING + 30 + (self.selected_idx - start) * MENU_ITEM_HEIGHT
+        return self.compose(frame, "Menu", (MENU_PADDING, y_offset, width - MENU_PADDING, y_offset + MENU_ITEM_HEIGHT))
 
+    def draw_items(self, draw, start):
         # Shift content down below the top bar
         y_offset = MENU_PADDING + 30  # Add space for top bar
-
-        start = max(0, self.selected_idx - self.visible_items() // 2)
         end = min(len(MENU_ITEMS), start + self.visible_items())
 
         for i in range(start, end):
-            if i == self.selected_idx:
-                draw.rectangle((MENU_PADDING, y_offset, width - MENU_PADDING, y_offset + MENU_ITEM_HEIGHT), outline=BLACK)
             draw.text((2*MENU_PADDING, y_offset + 15), MENU_ITEMS[i], font=load_font(settings['font_name'], settings['font_size']), fill=BLACK)
             y_offset += MENU_ITEM_HEIGHT
 
-        return image
-
     def visible_items(self):
         # Adjust for the top bar
         return (height - 2*MENU_PADDING - 30) // MENU_ITEM_HEIGHT
@@ -270,7 +335,7 @@ class MainMenu(MenuScreen):
 
             print("\nWybierz opcję: [w/s] góra/dół, [Enter] wybór")
             print(self.selected_idx)
-            key = input("Wybierz: ")
+            key = self.read_key("Wybierz: ")
             if self.handle_input(key.lower().strip()):
                 break
 
@@ -280,15 +345,14 @@ class FontSizeMenu(MenuScreen):
         self.selected_idx = FONT_SIZES.index(settings['font_size'])
 
     def get_font_size_image(self):
-        image = self.app.empty_image.copy()
-        draw = ImageDraw.Draw(image)
+        frame = self.get_frame(settings['font_name'], self.draw_items)
 
-        y_offset = MENU_PADDING + 30
-        self.draw_top_bar(image, screen_name="Rozmiar czcionki")
+        y_offset = MENU_PADDING + 30 + self.selected_idx * MENU_ITEM_HEIGHT
+        return self.compose(frame, "Rozmiar czcionki", (MENU_PADDING, y_offset, width - MENU_PADDING, y_offset + MENU_ITEM_HEIGHT))
 
-        for i, size in enumerate(FONT_SIZES):
-            if i == self.selected_idx:
-                draw.rectangle((MENU_PADDING, y_offset, width - MENU_PADDING, y_offset + MENU_ITEM_HEIGHT), outline=BLACK)
+    def draw_items(self, draw):
+        y_offset = MENU_PADDING + 30
+        for size in FONT_SIZES:
             draw.text(
                 (2*MENU_PADDING, y_offset + 15),
                 f"Rozmiar {size}px",
@@ -298,7 +362,6 @@ class FontSizeMenu(MenuScreen):
             y_offset += MENU_ITEM_HEIGHT
 
         draw.text((MENU_PADDING, height - 30), "Enter: wybierz  q: powrót", font=status_font, fill=BLACK)
-        return image
 
     def get_items(self):
         return FONT_SIZES
@@ -317,7 +380,7 @@ class FontSizeMenu(MenuScreen):
                 
             print("\nWybierz opcję: [w/s] góra/dół, [Enter] wybór")
             print(self.selected_idx)
-            key = input("Wybierz: ")
+            key = self.read_key("Wybierz: ")
             if self.handle_input(key.lower().strip()):
                 break
 
@@ -328,14 +391,14 @@ class FontMenu(MenuScreen):
         self.selected_idx = self.fonts.index(settings['font_name']) if settings['font_name'] in self.fonts else 0
 
     def get_font_choice_image(self):
-        image = self.app.empty_image.copy()
-        draw = ImageDraw.Draw(image)
+        frame = self.get_frame(settings['font_size'], self.draw_items)
 
-        self.draw_top_bar(image, screen_name="Czcionka")
+        y_offset = MENU_PADDING + 30 + self.selected_idx * MENU_ITEM_HEIGHT
+        return self.compose(frame, "Czcionka", (MENU_PADDING, y_offset, width - MENU_PADDING, y_offset + MENU_ITEM_HEIGHT))
+
+    def draw_items(self, draw):
         y_offset = MENU_PADDING + 30
-        for i, font_name in enumerate(self.fonts):
-            if i == self.selected_idx:
-                draw.rectangle((MENU_PADDING, y_offset, width - MENU_PADDING, y_offset + MENU_ITEM_HEIGHT), outline=BLACK)
+        for font_name in self.fonts:
             draw.text(
                 (2*MENU_PADDING, y_offset + 15),
                 font_name,
@@ -345,7 +408,6 @@ class FontMenu(MenuScreen):
             y_offset += MENU_ITEM_HEIGHT
 
         draw.text((MENU_PADDING, height - 30), "Enter: wybierz  q: powrót", font=status_font, fill=BLACK)
-        return image
 
     def get_items(self):
         return self.fonts
@@ -362,7 +424,7 @@ class FontMenu(MenuScreen):
                 self.update_display(self.get_font_choice_image(), partial=True)
                 prev = self.selected_idx
             print("\nWybierz czcionkę: [w/s] wybór, [Enter] zatwierdź, [q] powrót")
-            if self.handle_input(input("Wybierz: ").lower().strip()):
+            if self.handle_input(self.read_key("Wybierz: ").lower().strip()):
                 break
 
 # File manager
@@ -386,19 +448,17 @@ class FileManager(MenuScreen):
         return True
 
     def get_file_image(self):
-        image = self.app.empty_image.copy()
-        draw = ImageDraw.Draw(image)
+        start = max(0, self.selected_idx - self.max_items() // 2)
+        frame = self.get_frame((settings['font_name'], settings['font_size'], start), lambda draw: self.draw_items(draw, start))
 
-        self.draw_top_bar(image, screen_name="Wybór książki")
+        y_offset = FM_PADDING + 30 + (self.selected_idx - start) * FM_ITEM_HEIGHT
+        return self.compose(frame, "Wybór książki", (FM_PADDING, y_offset, width - FM_PADDING, y_offset + FM_ITEM_HEIGHT))
 
+    def draw_items(self, draw, start):
         y_offset = FM_PADDING + 30
-
-        start = max(0, self.selected_idx - self.max_items() // 2)
         end = min(len(self.files), start + self.max_items())
 
         for i in range(start, end):
-            if i == self.selected_idx:
-                draw.rectangle((FM_PADDING, y_offset, width - FM_PADDING, y_offset + FM_ITEM_HEIGHT), outline=BLACK)
             name = self.files[i][:27] + "..." if len(self.files[i]) > 30 else self.files[i]
             draw.text(
                 (2 * FM_PADDING, y_offset + 10),
@@ -415,8 +475,6 @@ class FileManager(MenuScreen):
             fill=BLACK
         )
 
-        return image
-
     def max_items(self):
         return (height - 2 * FM_PADDING) // FM_ITEM_HEIGHT
 
@@ -427,7 +485,7 @@ class FileManager(MenuScreen):
                 self.update_display(self.get_file_image(), partial=True)
                 prev_idx = self.selected_idx
             print("\nWybierz książkę: [w/s] góra/dół, [d] otwórz, [a] powrót")
-            key = input("Wybierz: ").lower().strip()
+            key = self.read_key("Wybierz: ").lower().strip()
             if not key:
                 continue
             if self.handle_input(key):
@@ -439,77 +497,40 @@ class Reader(Screen):
     def __init__(self, app):
         super().__init__(app)
         self.pages, self.current_page, self.total_pages = [], 0, 0
+        self.paragraphs, self.page_starts = [], []
+        self.displayed_page = -1
         self.current_book_path = None
 
     def save_progress(self, book_path):
         reading_progress[book_path] = self.current_page
+        # Written to disk once the reader stops turning pages
+        self.app.scheduler.submit("save_progress", self.flush_progress(), priority=0, essential=True)
+
+    def flush_progress(self):
+        snapshot = dict(reading_progress)
+        yield
         with open(progress_path, 'w') as f:
-            json.dump(reading_progress, f)
+            json.dump(snapshot, f)
+
+    def layout_args(self, chain, font_size):
+        # Font size, line width and lines per page of the reader's text area, as passed to paginate()
+        line_height = chain.font(0, font_size).getbbox("A")[3] + RD_LINE_SPACING
+        lines_per_page = (height - RD_TOP_MARGIN - RD_BOTTOM_MARGIN) // line_height
+        return font_size, width - 2 * RD_SIDE_MARGIN, lines_per_page
 
     def load_epub(self, path):
         full_paragraphs = []
 
         self.current_book_path = path
 
-        with zipfile.ZipFile(path, 'r') as epub:
-            # Parse container.xml to get OPF path
-            with epub.open('META-INF/container.xml') as f:
-                container = BeautifulSoup(f.read(), 'xml')
-                opf_path = container.rootfiles.rootfile['full-path']
-
-            opf_dir = os.path.dirname(opf_path)
-            with epub.open(opf_path) as f:
-                opf = BeautifulSoup(f.read(), 'xml')
-
-            # Get spine-based reading order
-            item_map = {item['id']: item['href'] for item in opf.find_all('item') if 'application/xhtml+xml' in item.get('media-type', '')}
-            spine_ids = [item['idref'] for item in opf.find_all('itemref')]
-
-            for idref in spine_ids:
-                href = item_map.get(idref)
-                if not href:
-                    continue
-                
-                path_in_zip = f"{opf_dir}/{href}" if opf_dir else href
-
-                with epub.open(path_in_zip) as f:
-                    html = BeautifulSoup(f.read(), 'html.parser')
-                    for tag in html(['header', 'footer', 'nav', 'script', 'style']):
-                        tag.decompose()
-                    paragraphs = [p.get_text(strip=True) for p in html.find_all(['p', 'div']) if p.get_text(strip=True)]
-                    full_paragraphs.extend(paragraphs)
+        book = open_epub(path)
+        for index in range(len(book.spine)):
+            full_paragraphs.extend(book.paragraphs(index))
 
         # Text layout
-        dummy_img = Image.new('RGB', (1, 1))
-        draw = ImageDraw.Draw(dummy_img)
-        font = load_font(settings['font_name'], settings['font_size'])
-        line_height = font.getbbox("A")[3] + RD_LINE_SPACING
-        lines_per_page = (height - RD_TOP_MARGIN - RD_BOTTOM_MARGIN) // line_height
-        max_width = width - 2 * RD_SIDE_MARGIN
-
-        self.pages = []
-        current_lines = []
-
-        for para in full_paragraphs:
-            words = para.split()
-            line = ""
-            for word in words:
-                test_line = f"{line} {word}".strip()
-                if draw.textlength(test_line, font=font) <= max_width:
-                    line = test_line
-                else:
-                    current_lines.append(line)
-                    line = word
-            if line:
-                current_lines.append(line)
-            current_lines.append("")  # paragraph break
-
-            while len(current_lines) >= lines_per_page:
-                self.pages.append("\n".join(current_lines[:lines_per_page]))
-                current_lines = current_lines[lines_per_page:]
-
-        if current_lines:
-            self.pages.append("\n".join(current_lines))
+        chain = load_font_chain(settings['font_name'])
+        self.pages, self.page_starts = paginate(full_paragraphs, chain, *self.layout_args(chain, settings['font_size']))
+        self.paragraphs = full_paragraphs
 
         self.current_page = 0
 
@@ -524,7 +545,8 @@ class Reader(Screen):
     def get_page_image(self):
         image = self.app.empty_image.copy()
         draw = ImageDraw.Draw(image)
-        font = load_font(settings['font_name'], settings['font_size'])
+        chain = load_font_chain(settings['font_name'])
+        font = chain.font(0, settings['font_size'])
 
         # Top bar
         draw.rectangle((0, 0, width, RD_STATUS_BAR_HEIGHT), fill=WHITE, outline=BLACK)
@@ -545,7 +567,7 @@ class Reader(Screen):
         # Text body
         y = RD_TOP_MARGIN
         for line in self.pages[self.current_page].split('\n'):
-            draw.text((RD_SIDE_MARGIN, y), line, font=font, fill=BLACK)
+            chain.draw_text(draw, (RD_SIDE_MARGIN, y), line, settings['font_size'], BLACK)
             line_height = font.getbbox("A")[3] + RD_LINE_SPACING
             y += line_height
         return image
@@ -555,20 +577,69 @@ class Reader(Screen):
             self.current_page -= 1
         elif key == 'w' and self.current_page < self.total_pages - 1:
             self.current_page += 1
+        elif key == 'f':
+            self.search()
         elif key in ['a']:
             self.app.current_mode = "main_menu"
             return True
         return True
 
+    def show_page(self):
+        self.update_display(self.get_page_image())
+        self.displayed_page = self.current_page
+
+    def search(self):
+        query = self.read_key("Szukaj: ").strip()
+        if not query:
+            return
+
+        # Scans the paragraphs in the background; hits show up as they are found
+        search = BookSearch(self.paragraphs, self.page_starts, query)
+        start_page = self.current_page
+        hit_idx = -1
+        try:
+            while True:
+                hits = search.hits
+                status = "" if search.done else " (szukanie...)"
+                print(f"\n\"{query}\": {len(hits)} wyników{status}")
+                if hit_idx >= 0:
+                    print(f"Wynik {hit_idx+1}/{len(hits)}, strona {self.current_page+1}/{self.total_pages}")
+                print(f"[w/s] następny/poprzedni wynik, [Enter] odśwież, [c] czytaj od wyniku, [a] powrót na stronę {start_page+1}")
+
+                key = self.read_key("Wybierz: ").lower().strip()
+                if key == 'a':
+                    # Back to where the user was reading, so progress is not saved on a hit page
+                    self.current_page = start_page
+                    break
+                elif key == 'c':
+                    break
+                elif key in ('w', 's'):
+                    if hit_idx < 0:
+                        # Nearest hits around the page the search started from
+                        first = search.first_hit_from(start_page)
+                        idx = first if key == 'w' else first - 1
+                    else:
+                        idx = hit_idx + 1 if key == 'w' else hit_idx - 1
+                    if not 0 <= idx < len(hits):
+                        continue
+                    hit_idx = idx
+                else:
+                    continue
+
+                self.current_page = hits[hit_idx].page
+                if self.current_page != self.displayed_page:
+                    self.show_page()
+        finally:
+            search.stop()
+
     def run(self):
-        prev = -1
+        self.displayed_page = -1
         while True:
-            if self.current_page != prev:
-                self.update_display(self.get_page_image())
-                prev = self.current_page
+            if self.current_page != self.displayed_page:
+                self.show_page()
             print(f"\nStrona {self.current_page+1}/{self.total_pages}")
-            print("[s/w] ←/→, [a] powrót/menu")
-            if self.handle_input(input("Wybierz: ").lower().strip()):
+            print("[s/w] ←/→, [f] szukaj, [a] powrót/menu")
+            if self.handle_input(self.read_key("Wybierz: ").lower().strip()):
                 if self.app.current_mode == "main_menu":
                     break
             self.save_progress(self.app.reader.current_book_path)
@@ -580,6 +651,7 @@ class EbookReader:
         self.epd = epd
         self.empty_image = Image.new('1', (width, height), WHITE)
         self.current_mode = "main_menu"
+        self.scheduler = IdleScheduler(battery_percentage)
         self.main_menu = MainMenu(self)
         self.fontsize_menu = FontSizeMenu(self)
         self.font_menu = FontMenu(self)
@@ -587,8 +659,15 @@ class EbookReader:
         self.reader = Reader(self)
         self.startup = StartupAnimationScreen(self)
 
+    def warm_font_chains(self):
+        for font_name in available_fonts:
+            load_font_chain(font_name).font(0, settings['font_size'])
+            yield
+
     def run(self):
         try:
+            self.scheduler.start()
+            self.scheduler.submit("warm_font_chains", self.warm_font_chains(), priority=20)
             self.startup.run()
             while True:
                 if self.current_mode == "main_menu":
@@ -604,6 +683,9 @@ class EbookReader:
         except KeyboardInterrupt:
             print("Zamykanie...")
         finally:
+            self.scheduler.stop()
+            self.scheduler.run_essential()
+            self.scheduler.print_report()
             self.epd.sleep()
 
 if __name__ == "__main__":
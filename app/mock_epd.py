@@ -1,28 +1,117 @@
+import time
 import tkinter as tk
 from PIL import Image, ImageTk
 
+# Przełącznik: czy mock ma naprawdę czekać tyle, ile trwa operacja na panelu
+SIMULATE_LATENCY = 0
+
+# Waveshare 7.5" e-Paper V2 (800x480), values from the panel spec / wiki
+FULL_REFRESH_TIME = 5.0       # s
+PARTIAL_REFRESH_TIME = 0.4    # s
+INIT_TIME = 0.2               # s, reset + booster soft start + power on
+INIT_PART_TIME = 0.1          # s, reset + partial LUT setup
+SLEEP_TIME = 0.01             # s, power off + deep sleep command
+REFRESH_POWER = 26.4          # mW while the panel is busy
+STANDBY_POWER = 0.017         # mW in deep sleep
+IDLE_POWER = 1.0              # mW powered on between refreshes (estimate, controller + booster left on)
+GHOSTING_LIMIT = 5            # partial refreshes before a full one is recommended
+
+OPERATION_TIMES = {
+    'init': INIT_TIME,
+    'init_part': INIT_PART_TIME,
+    'full_refresh': FULL_REFRESH_TIME,
+    'partial_refresh': PARTIAL_REFRESH_TIME,
+    'sleep': SLEEP_TIME,
+}
+
 class MockEPD:
     width = 480
     height = 800
 
-    def __init__(self):
+    def __init__(self, headless=False, simulate_latency=SIMULATE_LATENCY):
         self.image = Image.new('1', (self.width, self.height), 255)  # White image
         self.image_showed = False
         self.root = None
         self.canvas = None
+        self.headless = headless
+        self.simulate_latency = simulate_latency
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.partial_mode = False
+        self.asleep = False
+        self.sim_time = 0.0       # s spent busy on the panel
+        self.clock = 0.0          # simulated s: busy time plus dwell()
+        self.energy = 0.0         # mJ
+        self.idle_energy = 0.0    # mJ of it spent between operations (powered idle or deep sleep)
+        self.op_counts = {op: 0 for op in OPERATION_TIMES}
+        self.ghosting = 0         # partial refreshes since the last full one
+        self.max_ghosting = 0
+
+    def _simulate(self, op):
+        if op in ('init', 'init_part'):
+            self.asleep = False
+
+        duration = OPERATION_TIMES[op]
+        self.op_counts[op] += 1
+        self.sim_time += duration
+        self.clock += duration
+        self.energy += REFRESH_POWER * duration
+
+        if op == 'full_refresh':
+            self.ghosting = 0
+        elif op == 'partial_refresh':
+            self.ghosting += 1
+            self.max_ghosting = max(self.max_ghosting, self.ghosting)
+            if self.ghosting == GHOSTING_LIMIT + 1:
+                print(f"MockEPD: {self.ghosting} partial refreshes without a full one, ghosting likely")
+
+        if self.simulate_latency:
+            time.sleep(duration)
+
+    def dwell(self, seconds):
+        """
+        Advances the simulated clock without panel activity (e.g. reading a page),
+        charging deep sleep or powered idle draw depending on the panel state.
+        """
+        idle = (STANDBY_POWER if self.asleep else IDLE_POWER) * seconds
+        self.clock += seconds
+        self.energy += idle
+        self.idle_energy += idle
+
+    def report(self):
+        """Simulated panel cost of the session so far."""
+        return {
+            'seconds': self.sim_time,
+            'clock': self.clock,
+            'energy_mj': self.energy,
+            'idle_mj': self.idle_energy,
+            'operations': dict(self.op_counts),
+            'max_ghosting': self.max_ghosting,
+        }
+
+    def print_report(self):
+        counts = ", ".join(f"{op} {n}" for op, n in self.op_counts.items())
+        print(f"MockEPD: session {self.sim_time:.1f} s busy, {self.energy:.1f} mJ ({self.idle_energy:.1f} mJ idle)"
+              f" | {counts} | max ghosting {self.max_ghosting}")
 
     def init(self):
         print("MockEPD: init")
+        self._simulate('init')
+        self.partial_mode = False
         self.image = Image.new('1', (self.width, self.height), 255)  # Default blank white image
         self.image_showed = True
 
     def init_part(self):
         print("MockEPD: partial init")
+        self._simulate('init_part')
+        self.partial_mode = True
         self.image = Image.new('1', (self.width, self.height), 255)  # Default blank white image
         self.image_showed = True
 
     def Clear(self):
         print("MockEPD: clear")
+        self._simulate('full_refresh')
         self.image = Image.new('1', (self.width, self.height), 255)  # Clear to white
         self.image_showed = False
         self.update_display()
@@ -31,6 +120,7 @@ class MockEPD:
         return image
 
     def display(self, image):
+        self._simulate('partial_refresh' if self.partial_mode else 'full_refresh')
         if image != self.image:
             self.image = image
         print("MockEPD: display updated")
@@ -38,6 +128,9 @@ class MockEPD:
         self.update_display()
 
     def update_display(self):
+        if self.headless:
+            return
+
         if not self.image_showed:
             # Create a Tkinter window to display the image for the first time
             self.root = tk.Tk()
@@ -48,7 +141,7 @@ class MockEPD:
             self.canvas.pack()
 
             self.image_showed = True
-        
+
         # Convert PIL image to Tkinter-compatible format
         photo = ImageTk.PhotoImage(self.image)
 
@@ -62,6 +155,12 @@ class MockEPD:
         self.root.update()
 
     def sleep(self):
+        if self.asleep:
+            # Already in deep sleep (e.g. "Wyłącz urządzenie" followed by the exit path)
+            return
         print("MockEPD: sleep")
+        self._simulate('sleep')
+        self.asleep = True
+        self.print_report()
         if self.root:
             self.root.quit()  # Close the Tkinter window
@@ -0,0 +1,132 @@
+# scheduler.py
+import threading
+import time
+
+IDLE_INTERVAL = 3.0         # s bez wciśnięcia klawisza, zanim ruszą zadania w tle
+MIN_BATTERY_PCT = 20        # poniżej tego poziomu zadania w tle czekają
+BATTERY_RETRY_INTERVAL = 60.0   # s between battery checks while optional work waits
+
+
+class Job:
+    def __init__(self, name, steps, priority, essential):
+        self.name = name
+        self.steps = steps
+        self.priority = priority
+        self.essential = essential
+        self.cpu_time = 0.0
+
+
+class IdleScheduler:
+    """
+    Cooperative scheduler for deferred work. A job is a generator: each `yield`
+    marks a point where it can be pre-empted. Steps run in a background thread,
+    only after input has been idle for `idle_interval` seconds and the battery
+    (as reported by the `battery_percentage` callable) is above `min_battery`.
+    Any input pre-empts the running job at its next yield.
+    Essential jobs (e.g. saving reading progress) ignore the battery threshold
+    and are the only ones still run on exit.
+    """
+
+    def __init__(self, battery_percentage, idle_interval=IDLE_INTERVAL, min_battery=MIN_BATTERY_PCT):
+        self.battery_percentage = battery_percentage
+        self.idle_interval = idle_interval
+        self.min_battery = min_battery
+        self.jobs = []
+        self.cpu_times = {}
+        self.last_input = time.monotonic()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._worker, name="idle-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+
+    def submit(self, name, job, priority=10, essential=False):
+        """
+        Queues a generator. A pending job with the same name is replaced, so
+        repeated requests (e.g. progress flushes) collapse into one.
+        Lower priority values run first.
+        """
+        with self._lock:
+            self.jobs = [j for j in self.jobs if j.name != name]
+            self.jobs.append(Job(name, job, priority, essential))
+            self.jobs.sort(key=lambda j: j.priority)
+        self._wake.set()
+
+    def notify_input(self):
+        self.last_input = time.monotonic()
+        self._wake.set()
+
+    def is_idle(self):
+        return time.monotonic() - self.last_input >= self.idle_interval
+
+    def battery_ok(self):
+        return self.battery_percentage() >= self.min_battery
+
+    def run_essential(self):
+        """Runs the queued essential jobs in the calling thread and drops the rest (on exit)."""
+        with self._lock:
+            essential = [j for j in self.jobs if j.essential]
+            self.jobs = essential[:]
+        for job in essential:
+            self._step(job, preemptible=False)
+
+    def print_report(self):
+        if self.cpu_times:
+            times = ", ".join(f"{name} {cpu * 1000:.1f} ms" for name, cpu in self.cpu_times.items())
+            print(f"Scheduler: CPU time per job: {times}")
+
+    def _worker(self):
+        while not self._stopped:
+            if not self.jobs:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            remaining = self.idle_interval - (time.monotonic() - self.last_input)
+            if remaining > 0:
+                self._wake.wait(remaining)
+                self._wake.clear()
+                continue
+
+            battery_ok = self.battery_ok()
+            with self._lock:
+                runnable = [j for j in self.jobs if battery_ok or j.essential]
+                job = runnable[0] if runnable else None
+            if job is None:
+                # Only optional work left and the battery is low
+                self._wake.wait(BATTERY_RETRY_INTERVAL)
+                self._wake.clear()
+                continue
+            self._step(job, preemptible=True)
+
+    def _step(self, job, preemptible):
+        started_at = self.last_input
+        while True:
+            start = time.thread_time()
+            try:
+                next(job.steps)
+                done = False
+            except StopIteration:
+                done = True
+            except Exception as e:
+                print(f"Scheduler: job {job.name} failed: {e}")
+                done = True
+            job.cpu_time += time.thread_time() - start
+
+            if done:
+                with self._lock:
+                    if job in self.jobs:
+                        self.jobs.remove(job)
+                self.cpu_times[job.name] = self.cpu_times.get(job.name, 0.0) + job.cpu_time
+                return
+            if preemptible and (self._stopped or self.last_input != started_at):
+                return
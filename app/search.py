@@ -0,0 +1,44 @@
+# search.py
+import bisect
+import re
+import threading
+from collections import namedtuple
+
+Hit = namedtuple('Hit', ['page', 'paragraph', 'offset'])
+
+
+class BookSearch:
+    """
+    Case-insensitive search over the book's paragraphs, run in a background
+    thread. Hits are appended to `hits` as they are found, already mapped to
+    pages through the layout's page starts.
+    """
+
+    def __init__(self, paragraphs, page_starts, query):
+        self.paragraphs = paragraphs
+        self.page_starts = page_starts
+        self.pattern = re.compile(re.escape(query), re.IGNORECASE)
+        self.hits = []
+        self.done = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._scan, name="book-search", daemon=True)
+        self._thread.start()
+
+    def page_of(self, paragraph, offset):
+        return max(bisect.bisect_right(self.page_starts, (paragraph, offset)) - 1, 0)
+
+    def first_hit_from(self, page):
+        """Index of the first hit found so far on `page` or later (len(hits) if none)."""
+        return bisect.bisect_left(self.hits, page, key=lambda hit: hit.page)
+
+    def _scan(self):
+        for para_idx, para in enumerate(self.paragraphs):
+            if self._stopped.is_set():
+                return
+            for match in self.pattern.finditer(para):
+                self.hits.append(Hit(self.page_of(para_idx, match.start()), para_idx, match.start()))
+        self.done = True
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
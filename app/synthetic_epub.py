@@ -0,0 +1,109 @@
+# synthetic_epub.py
+# Generator syntetycznych plików EPUB do testów skalowania: python synthetic_epub.py <rozmiar_MB> [kształt]
+import os
+import random
+import sys
+import zipfile
+
+WORDS = ("the a and of to in was he she it that said had his her with for on at as "
+         "Harry looked back door night quietly książka źródło żółw gęś łąka “quoted” — … "
+         "wand castle letter morning window before after again another something").split()
+
+# Book shapes: (spine item size, paragraph size, div nesting depth around each paragraph), in bytes of text
+SHAPES = {
+    'chapters': (64 * 1024, 600, 0),
+    'many_items': (2 * 1024, 400, 0),
+    'single_file': (None, 600, 0),
+    'long_paragraphs': (256 * 1024, 32 * 1024, 0),
+    'deep_nesting': (64 * 1024, 600, 8),
+}
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+CHAPTER_HEAD = """<?xml version="1.0" encoding="utf-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head><title>Chapter {number}</title><style>p {{ margin: 0; }}</style></head>
+<body>
+<h1>Chapter {number}</h1>
+"""
+
+
+def random_paragraph(rng, size):
+    words, length = [], 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def write_chapter(f, rng, number, chapter_size, paragraph_size, depth):
+    f.write(CHAPTER_HEAD.format(number=number).encode('utf-8'))
+    written = 0
+    while written < chapter_size:
+        text = random_paragraph(rng, paragraph_size)
+        f.write(("<div>" * depth + f"<p>{text}</p>" + "</div>" * depth + "\n").encode('utf-8'))
+        written += len(text)
+    f.write(b"</body>\n</html>\n")
+
+
+def generate_epub(path, size_mb, shape='chapters', seed=0):
+    """
+    Writes a synthetic EPUB with about `size_mb` MB of paragraph text.
+
+    Args:
+        path (str): Output .epub path.
+        size_mb (float): Amount of text in MB (before compression and markup).
+        shape (str): One of SHAPES.
+        seed (int): Seed for the word generator, the same seed gives the same book.
+
+    Returns:
+        int: Number of spine items.
+    """
+    chapter_size, paragraph_size, depth = SHAPES[shape]
+    total = int(size_mb * 1024 * 1024)
+    chapter_size = chapter_size or total
+    chapters = max(1, -(-total // chapter_size))
+    rng = random.Random(seed)
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as epub:
+        # mimetype must be the first, uncompressed member
+        epub.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        epub.writestr('META-INF/container.xml', CONTAINER_XML)
+
+        for number in range(chapters):
+            with epub.open(f'OEBPS/chapter{number:05d}.xhtml', 'w', force_zip64=True) as f:
+                write_chapter(f, rng, number, min(chapter_size, total - number * chapter_size), paragraph_size, depth)
+
+        manifest = "\n".join(f'    <item id="ch{n}" href="chapter{n:05d}.xhtml" media-type="application/xhtml+xml"/>' for n in range(chapters))
+        spine = "\n".join(f'    <itemref idref="ch{n}"/>' for n in range(chapters))
+        epub.writestr('OEBPS/content.opf', f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="id">synthetic-{shape}-{size_mb}-{seed}</dc:identifier>
+    <dc:title>Synthetic {shape} {size_mb} MB</dc:title>
+    <dc:language>en</dc:language>
+  </metadata>
+  <manifest>
+{manifest}
+  </manifest>
+  <spine>
+{spine}
+  </spine>
+</package>
+""")
+    return chapters
+
+
+if __name__ == "__main__":
+    size = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    shape = sys.argv[2] if len(sys.argv) > 2 else 'chapters'
+    out = f"synthetic_{shape}_{size:g}MB.epub"
+    items = generate_epub(out, size, shape)
+    print(f"{out}: {items} spine items, {os.path.getsize(out) / 1024 / 1024:.1f} MB on disk")